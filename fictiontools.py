@@ -4,10 +4,10 @@
 """
 Tools for building interactive fiction adventure games using statemachine.py
 """
-from collections import defaultdict
+from collections import defaultdict, namedtuple
 import random
 import re
-# import time
+import sys
 
 import statemachine as sm
 #####
@@ -33,6 +33,22 @@ def message_spacer(m):
 
 
 ###  Map Maker  ###
+MAP_KEY_SECTION_RE = re.compile(r"\s*Key:")
+MAP_SECTION_RE = re.compile(r"\s*Map:")
+MAP_KEY_RE = re.compile(r"(?P<key>\w+):\s*(?P<name>\w+)")
+MAP_LEX_RE = re.compile(r"(?P<room>\[\w+\])|(?P<passage>[-+]+)")  # REM: this pattern doesn't explicitly identify ignored chars, have to check spans
+MapToken = namedtuple("MapToken", ("kind", "start", "end", "name"))
+
+
+def lex_map_line(l):
+    "Yields `MapToken`s for the rooms and passages in a line of a map; rooms are named by the text in their brackets"
+    for m in MAP_LEX_RE.finditer(l):
+        if m.group("room"):
+            yield MapToken("room", m.start(), m.end(), m.group("room").strip("[]"))
+        else:
+            yield MapToken("passage", m.start(), m.end(), None)
+
+
 class Map:
     def __init__(self, map_str=None):
         self.rooms = defaultdict(dict)  # {name: {"n": name, ...},...}
@@ -45,42 +61,29 @@ class Map:
         map_tokens = []
         map_key = {}
 
-        key_section = sm.matchTest(r"\s*Key:")
-        key_re = re.compile(r"(?P<key>\w+):\s*(?P<name>\w+)")
-        key_match = lambda i,_: key_re.findall(i)
-        def add_keys(_,t):
-            map_key.update(dict(t.result))
-
-        # Tests and actions:
-        map_section = sm.matchTest(r"\s*Map:")
-        lex_re = re.compile(r"(?P<room>\[\w+\])|(?P<passage>[-+]+)")  # REM: this pattern doesn't explicitly identify ignored chars, have to check spans
-        lex_match = lambda i,_: lex_re.finditer(i)  # REM: finditer result is always truish
-        def store_tokens(i,t):
-            map_lines.append(i)
-            map_tokens.append(list(t.result))
-
-        # Build the parser:
-        p = sm.StateMachine("map")
-        p.build("map", 
-            (key_section, "key"),
-            (lex_match, None, store_tokens),
-        )
-        p.build("key",
-            (map_section, "map"),
-            (key_match, None, add_keys),
-            (sm.trueTest, None),  # Ignore key lines with no definitions
-        )
+        # Lines are map lines until a "Key:" section, which continues until a "Map:" section
+        in_key = False
         for l in map_str.splitlines():
-            p.input(l)
+            if in_key:
+                if MAP_SECTION_RE.match(l):
+                    in_key = False
+                else:
+                    map_key.update(MAP_KEY_RE.findall(l))  # Key lines with no definitions are ignored
+            elif MAP_KEY_SECTION_RE.match(l):
+                in_key = True
+            else:
+                map_lines.append(l)
+                map_tokens.append(list(lex_map_line(l)))
 
         self._configure_rooms(map_lines, map_tokens, map_key)
 
 
     def _configure_rooms(self, map_lines, map_tokens, map_key):
-        def room_name(m):
-            r = m.group("room").strip("[]")
-            r = map_key.get(r, r)
-            return r
+        # Resolve room names from the key once up front; the key can follow the map, so this can't be done while lexing
+        map_tokens = [
+            [ t._replace(name=map_key.get(t.name, t.name)) if t.kind == "room" else t for t in t_list ]
+            for t_list in map_tokens
+        ]
 
         def overlap(*spans):
             start = max(s[0] for s in spans)
@@ -88,19 +91,20 @@ class Map:
             return end - start if end > start else 0
 
         def room_search(tokens, span):
-            rooms = [ (room_name(t), overlap(span, t.span())) for t in tokens if t.group("room") ]
+            rooms = [ (t.name, overlap(span, (t.start, t.end))) for t in tokens if t.kind == "room" ]
             if not rooms:
                 return None
             (rm, o) = max(rooms, key=lambda x: x[1])
             return rm if o > 0 else None
 
-        vertical_re = re.compile(r"[|+]")
+        # Flag the columns of vertical passage chars once so following a passage is just a find per line
+        vertical_lines = [ bytes(c in "|+" for c in l) for l in map_lines ]
         def vertical_search(i, span):
             for x in range(i-1, -1, -1):
-                m = vertical_re.search(map_lines[x], *span)
-                if m:
+                c = vertical_lines[x].find(1, *span)
+                if c >= 0:
                     # Follow vertical passage chars until we reach a line without one in the right place...
-                    span = m.span()
+                    span = (c, c + 1)
                     continue
                 rm = room_search(map_tokens[x], span)
                 if rm:
@@ -115,19 +119,19 @@ class Map:
             prev_end = None
             prev_room = None
             for token in t_list:
-                if prev_end is not None and prev_end != token.start():
+                if prev_end is not None and prev_end != token.start:
                     prev_room = None  # break in the token spans means no connection
-                if token.group("room"):
-                    room = room_name(token)
+                if token.kind == "room":
+                    room = token.name
                     if prev_room:
                         self.connect(prev_room, room, "e", "w")
                     prev_room = room
-                    north_room = vertical_search(i, token.span())
+                    north_room = vertical_search(i, (token.start, token.end))
                     if north_room:
                         self.connect(room, north_room, "n", "s")
 
                 # "passage" tokens don't need anything done
-                prev_end = token.end()
+                prev_end = token.end
 
 
     def connect(self, rm1, rm2, d1, d2=None, lenient=False):
@@ -142,8 +146,7 @@ class Map:
 
 
     def build(self, world, commands, action, state_mapper=lambda r: r):
-        for room in self.rooms.keys():
-            directions = self.rooms[room]
+        for room, directions in self.rooms.items():
             rules = [ (commands[d], state_mapper(r), action) for d,r in directions.items() ]
             world.build(state_mapper(room), *rules)
 #####
@@ -156,7 +159,7 @@ class Command:
             self.test = test
             self._syns = syns  # when using a custom callable test, syns are still useful for help
         else:
-            self.test = sm.inTest([test, *syns])
+            self.test = sm.inTest((test, *syns))
             self._syns = [test, *syns]
 
         self.action = action
@@ -187,11 +190,14 @@ class Command:
 
 
 ###  REPL  ###
-def repl(world)
-    time.sleep(0.1)  # HACK: wait for flush; sometimes prompt prints out-of-order with print output in spite of flush=True
+def repl(world):
+    # Flush both streams before each prompt so it doesn't print out-of-order with other output
+    sys.stdout.flush()
+    sys.stderr.flush()
     print(world.input(input("Press enter to start. ")), flush=True)
     while True:
-        time.sleep(0.1)  # HACK: wait for flush
+        sys.stdout.flush()
+        sys.stderr.flush()
         out = world.input(input("> "))
         if out:
             print(out, flush=True)
@@ -200,8 +206,6 @@ def repl(world)
 
 ###  Main  ###
 if __name__ == "__main__":
-    # import sys
-    import time
     GRID_MAP = """
     [00]-01--[02][03][04]
      |        |       |
@@ -244,11 +248,5 @@ if __name__ == "__main__":
     world.add(None, lambda i,_: i != "crash", None, sorry_action, tag="Not crash")  # You can type "crash" to dump the state machine's trace
 
     print("Grid World", flush=True)
-    time.sleep(0.1)  # HACK: wait for flush; sometimes prompt prints out-of-order with print output in spite of flush=True
-    print(world.input(input("Press enter to start. ")), flush=True)
-    while True:
-        time.sleep(0.1)  # HACK: wait for flush
-        out = world.input(input("> "))
-        if out:
-            print(out, flush=True)
+    repl(world)
 #####
@@ -5,9 +5,13 @@ from collections import deque
 
 
 ###  State Machine Core  ###
+_INDEXABLE = frozenset((str, bytes, int, float, complex, bool, type(None)))  # Exact types whose hash agrees with ==
 class StateMachine(object):
     """A state machine engine that makes minimal assumptions but includes a few nice conveniences and powerful extensibility.
+
+    Rules are compiled per-state on first use; call refresh() (or assign rules again) after editing the rules dict in-place.
     """
+    __slots__ = ("_rules", "_compiled", "_state", "_tracer", "_trace_fn", "history", "_input_count")
 
     def __init__(self, rules, state, tracer=False, history=10):
         """Create a state machine instance which can be called with input and returns output from evaluating the rules for the current state.
@@ -27,6 +31,73 @@ class StateMachine(object):
         self.history = deque(maxlen=history)
         self._input_count = 0
 
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, rules):
+        self._rules = rules
+        self.refresh()
+
+    def refresh(self):
+        """Forget compiled rules, picking up in-place edits to the rules dict."""
+        self._compiled = {}
+
+    def _compile(self, state):
+        """Merges the explicit and implicit rules for a state and indexes their literal tests, so this isn't redone for every input."""
+        rule_list = (*self.rules[state], *self.rules.get(..., ()))
+        tested = []  # Rules with callable (or non-indexable) tests have to be tried in order
+        literals = {}  # Rules with simple literal tests can be looked up by the input
+        for n, (_,t,*_) in enumerate(rule_list):
+            if not callable(t) and type(t) in _INDEXABLE:
+                literals.setdefault(t, n)
+            else:
+                tested.append(n)
+        compiled = (rule_list, tuple(tested), literals)
+        if rule_list:  # An empty state may still be filled in
+            self._compiled[state] = compiled
+        return compiled
+
+    def _candidate_rules(self, state, input):
+        """Yields the state's rules, in order, skipping the literal ones that cannot equal the input."""
+        compiled = self._compiled.get(state)
+        if compiled is None:
+            compiled = self._compile(state)
+        rule_list, tested, literals = compiled
+        if type(input) not in _INDEXABLE:
+            yield from rule_list  # Only trust the lookup when hash and == are known to agree
+            return
+        literal_n = literals.get(input)
+        if literal_n is None:
+            for n in tested:
+                yield rule_list[n]
+            return
+        for n in tested:
+            if n > literal_n:
+                break
+            yield rule_list[n]
+        yield rule_list[literal_n]  # Re-checked by the caller, e.g. NaN is found by identity but isn't equal
+        for n in tested:
+            if n > literal_n:
+                yield rule_list[n]
+
+    @property
+    def tracer(self):
+        return self._tracer
+
+    @tracer.setter
+    def tracer(self, tracer):
+        # Work out how to trace once here rather than on every transition
+        self._tracer = tracer
+        if not tracer:
+            self._trace_fn = None
+        elif callable(tracer):
+            self._trace_fn = tracer
+        else:
+            prefix = tracer if tracer is not True else "T>"
+            self._trace_fn = lambda fmt, **context: print(f"{prefix} {fmt.format_map(context)}")
+
     @property
     def state(self):
         return self._state
@@ -54,47 +125,53 @@ class StateMachine(object):
 
         At the end of a successful transition, the internal and any custom tracer is called with a transition format and context arguments.
         """
-        self._input_count += 1
+        state = self.state
+        input_count = self._input_count = self._input_count + 1
         context = {
-            "machine": self, "state": self.state, 
-            "input_count": self._input_count, "input": input,
+            "machine": self, "state": state,
+            "input_count": input_count, "input": input,
         }
         try:
-            rule_list = self.rules[self.state] + self.rules.get(..., [])
-            for l,t,a,d in rule_list:
-                context.update({"label": l, "test": t, "action": a, "destination": d})
+            for l,t,a,d in self._candidate_rules(state, input):
+                # Only the rule elements change from rule to rule, update them in place
+                context["label"] = l
+                context["test"] = t
+                context["action"] = a
+                context["destination"] = d
                 result = t(**context) if callable(t) else t == input
                 if result:
-                    response = a(result=result, **context) if callable(a) else a
+                    context["result"] = result
+                    response = a(**context) if callable(a) else a
                     if d is not ...:
                         self.state = d
-                    self._trace(result=result, response=response, new_state=self.state, **context,)
+                    if self._trace_fn or self.history.maxlen != 0:  # Nothing to record with no tracer and history=0
+                        context["response"] = response
+                        context["new_state"] = self.state
+                        self._trace(context)
                     return response
-            else:
-                raise ValueError(f"State '{self.state}' did not recognize input {self._input_count}: '{input}'")
+            raise ValueError(f"State '{state}' did not recognize input {input_count}: '{input}'")
         except Exception as e:
             if self.history:
                 trace_lines = "\n  ".join(self.trace_lines())
                 e.add_note(f"StateMachine Traceback (most recent last):\n  {trace_lines}")
-            e.add_note(f"  {self._input_count}: {self.state}('{input}') >> 💥\n{type(e).__name__}: {e}")
+            e.add_note(f"  {input_count}: {self.state}('{input}') >> 💥\n{type(e).__name__}: {e}")
             raise
 
     _transition_fmt = "{input_count}: {state}('{input}') > {label}: {result} -- {response} --> {new_state}"
-    def _trace(self, **context):
-        if self.tracer:
-            if callable(self.tracer):
-                self.tracer(self._transition_fmt, **context)
-            else:
-                prefix = self.tracer if self.tracer is not True else "T>"
-                print(f"{prefix} {self._transition_fmt.format(**context)}")
+    def _trace(self, context):
+        if self._trace_fn:
+            self._trace_fn(self._transition_fmt, **context)
 
-        if self.history and context["state"] == context["new_state"]:
+        history = self.history
+        if history and context["state"] == context["new_state"]:
             context["loop_count"] = 1
-            prev = self.history[-1]
+            prev = history[-1]
             if "loop_count" in prev and prev["state"] == context["state"]:
+                # Fold the loop into the tail entry, which keeps the latest context for tracing
                 context["loop_count"] += prev["loop_count"]
-                self.history.pop()
-        self.history.append(context)
+                history[-1] = context
+                return
+        history.append(context)
 
     def trace_lines(self):
         """Returns trace lines from the history of transitions."""
@@ -102,5 +179,5 @@ class StateMachine(object):
             lc = context.get("loop_count", 0)
             if lc > 1:
                 yield f"    ({lc - 1} loops in {context['state']} elided)"
-            yield self._transition_fmt.format(**context)
+            yield self._transition_fmt.format_map(context)
 #####
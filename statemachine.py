@@ -32,12 +32,23 @@ def statemachine(rules=__, state=__, debug=False, history=__, checkpoints=__, tr
 
 
 ###  Test Helpers  ###
+_HASH_SAFE = frozenset((str, bytes, int, float, complex, bool, type(None)))  # Set membership only matches == for these exact types
 class in_test(object):
-    """Callable to test if input is in a collection and format a nice __str__."""
+    """Callable to test if input is in a collection and format a nice __str__.
+
+    A tuple of plain strings, numbers, etc. is also hashed into a frozenset for quicker lookup; any other collection, including a list, is checked as given so it can still be changed later.
+    """
+    __slots__ = ("in_list", "_lookup")
+
     def __init__(self, in_list):
         self.in_list = in_list
+        self._lookup = None
+        if isinstance(in_list, tuple) and all( type(i) in _HASH_SAFE for i in in_list ):
+            self._lookup = frozenset(in_list)
 
     def __call__(self, input, **_):
+        if self._lookup is not None and type(input) in _HASH_SAFE:
+            return input in self._lookup
         return input in self.in_list
 
     def __str__(self):
@@ -46,32 +57,42 @@ class in_test(object):
 
 class match_test(object):
     """Thin wrapper around re.match to format a nice __str__."""
+    __slots__ = ("test_re", "_match", "_str")
+
     def __init__(self, test_re_str):
         self.test_re = re.compile(test_re_str)
+        self._match = self.test_re.match  # Skips the attribute lookup per call
+        self._str = f"'{self.test_re.pattern}'.match(input)"  # Tracers may format this for every rule
 
     def __call__(self, input, **_):
-        return self.test_re.match(input)
+        return self._match(input)
 
     def __str__(self):
-        return f"'{self.test_re.pattern}'.match(input)"
+        return self._str
 
 
 class search_test(object):
     """Thin wrapper around re.search to format a nice __str__."""
+    __slots__ = ("test_re", "_search", "_str")
+
     def __init__(self, test_re_str):
         self.test_re = re.compile(test_re_str)
+        self._search = self.test_re.search
+        self._str = f"'{self.test_re.pattern}'.search(input)"
 
     def __call__(self, input, **_):
-        return self.test_re.search(input)
+        return self._search(input)
 
     def __str__(self):
-        return f"'{self.test_re.pattern}'.search(input)"
+        return self._str
 #####
 
 
 ###  Action Helpers  ###
 class pretty_action:
     """Decorator to wrap an action callable and give it a nice __str__; not needed if an action already prints nicely"""
+    __slots__ = ("action",)
+
     def __init__(self, action):
         self.action = action
 
@@ -100,6 +121,17 @@ class Tracepoint(Enum):
     UNKNOWN_STATE = "\t(Unknown state: {new_state})"  # Consider raising UnknownStateError
 
 
+# Looking up Enum members is surprisingly slow, the hot paths use these module-level references instead
+_TP_INPUT = Tracepoint.INPUT
+_TP_NO_RULES = Tracepoint.NO_RULES
+_TP_RULE = Tracepoint.RULE
+_TP_RESULT = Tracepoint.RESULT
+_TP_RESPONSE = Tracepoint.RESPONSE
+_TP_NEW_STATE = Tracepoint.NEW_STATE
+_TP_UNRECOGNIZED = Tracepoint.UNRECOGNIZED
+_TP_UNKNOWN_STATE = Tracepoint.UNKNOWN_STATE
+
+
 def format_transition(**t):
     """Format key items of statemachine context representing a partial or complete transition of a machine."""
     format_parts = (
@@ -110,9 +142,9 @@ def format_transition(**t):
         ("new_state", " --> {new_state}"),
     )
     fmt = "".join( f for k,f in format_parts if k in t )
-    line = fmt.format(**t)
+    line = fmt.format_map(t)
     tp = t.get("tracepoint")
-    if tp != Tracepoint.NEW_STATE:
+    if tp is not _TP_NEW_STATE:
         # Most transitions will finish at NEW_STATE, only annotate ones that don't
         name = tp.name if tp else "TRACEPOINT_MISSING"
         line += f" >> ({name})"
@@ -121,7 +153,10 @@ def format_transition(**t):
 
 class StateMachine(object):
     """A state machine engine that makes minimal assumptions but includes some nice conveniences and powerful extensibility.
+
+    Each state's rules are compiled the first time the machine is in that state; after editing the rules dict in-place, assign it to rules again or call refresh() so the changes are seen.
     """
+    __slots__ = ("_rules", "_compiled", "state", "tracers", "context", "_input_count")
 
     def __init__(self, rules=None, state=..., tracers=()):
         """Create a state machine instance which can be called with input and returns output from evaluating the rules for the current state.
@@ -130,11 +165,12 @@ class StateMachine(object):
 
         Rules associated with the special ... (Ellipsis) state are implicitly added to all states' rules, and evaluated after explicit rules.
 
+        Rules can be set after init by assigning to the rules attribute, which also discards any compiled rules; the rules dict can be edited in-place too, but call refresh() afterwards unless the edited states have not been used yet.
+
         State is simply the starting state for the machine; it defaults to the first state defined in the rules or None which is not a special value, it is simply a (possibly) valid state.
 
         Tracer is an optional callable that takes a Tracepoint and its associated values; it is called at critical points in the input processing to follow the internal operation of the machine.  A simple tracer can produce logs that are extremely helpful when debugging, see PrefixTracer for an example.  Tracepoints are distinct constants which can be used by more advanced tracers for selective verbosity, raising errors for unrecognized input or states, and other things.  Tracers can be stacked using MultiTracer.
         """
-        # Starting rules and state can be set after init, but really should be set before using the machine
         # rules dict looks like { state: [(label, test, action, new_state), ...], ...}
         self.rules = rules if rules is not None else {}
         if state is ...:
@@ -144,6 +180,29 @@ class StateMachine(object):
         self.context = {}
         self._input_count = 0
 
+    @property
+    def rules(self):
+        return self._rules
+
+    @rules.setter
+    def rules(self, rules):
+        self._rules = rules
+        self.refresh()
+
+    def refresh(self):
+        """Discards the compiled rules so in-place changes to the rules dict are seen by the next input."""
+        self._compiled = {}
+
+    def _compile(self, state):
+        """Merges the explicit and implicit rules for a state and notes which rule elements are callable, so that doesn't need to be re-checked for every input."""
+        rule_list = tuple(
+            (l, t, callable(t), a, callable(a), d, callable(d))
+            for l,t,a,d in (*self.rules.get(state, ()), *self.rules.get(..., ()))
+        )
+        if rule_list:  # Not cached while empty, rules may yet be added for this state
+            self._compiled[state] = rule_list
+        return rule_list
+
     def _trace(self, tp, **vals):
         """Updates the context and calls an external tracer if one is set."""
         self.context["tracepoint"] = tp
@@ -167,29 +226,33 @@ class StateMachine(object):
         - Destination: finally, if destination is callable it will be called with context arguments, including 'result' and 'response' above, to get the destination state, otherwise the literal value will be the destination.  If the destination state is '...', the machine will remain in the same state (self-transition or "loop".)  Callable destinations can implement state push/pop for recursion, state exit/enter actions, non-deterministic state changes, and other interesting things.
         """
         try:
-            self.context = {}
-            self._input_count += 1
-            self._trace(Tracepoint.INPUT, input_count=self._input_count, state=self.state, input=input)
-            rule_list = self.rules.get(self.state, []) + self.rules.get(..., [])
+            trace = self._trace  # Bound once, it's called several times for every rule
+            context = self.context
+            context.clear()  # Reuse the dict, callables and tracers only ever get copies of it
+            state = self.state
+            input_count = self._input_count = self._input_count + 1
+            trace(_TP_INPUT, input_count=input_count, state=state, input=input)
+            rule_list = self._compiled.get(state)
+            if rule_list is None:
+                rule_list = self._compile(state)
             if not rule_list:
-                self._trace(Tracepoint.NO_RULES, state=self.state)
-            for l,t,a,d in rule_list:
-                self._trace(Tracepoint.RULE, label=l, test=t, action=a, dest=d)
-                result = t(**self.context) if callable(t) else t == input
+                trace(_TP_NO_RULES, state=state)
+            for l,t,tc,a,ac,d,dc in rule_list:
+                trace(_TP_RULE, label=l, test=t, action=a, dest=d)
+                result = t(**context) if tc else t == input
                 if result:
-                    self._trace(Tracepoint.RESULT, label=l, result=result)
-                    response = a(**self.context) if callable(a) else a
-                    self._trace(Tracepoint.RESPONSE, response=response)
-                    dest = d(**self.context) if callable(d) else d
-                    self._trace(Tracepoint.NEW_STATE, new_state=dest)
+                    trace(_TP_RESULT, label=l, result=result)
+                    response = a(**context) if ac else a
+                    trace(_TP_RESPONSE, response=response)
+                    dest = d(**context) if dc else d
+                    trace(_TP_NEW_STATE, new_state=dest)
                     if dest is not ...:
                         if dest not in self.rules:
-                            self._trace(Tracepoint.UNKNOWN_STATE, new_state=dest)
+                            trace(_TP_UNKNOWN_STATE, new_state=dest)
                         self.state = dest
                     return response
-            else:
-                self._trace(Tracepoint.UNRECOGNIZED, input=input)
-                return None
+            trace(_TP_UNRECOGNIZED, input=input)
+            return None
         except Exception as e:
             # REM: maybe some way for tracers to annotate the exception with trace info / context / etc?
             notes = e.__notes__ if hasattr(e, "__notes__") else []
@@ -207,8 +270,8 @@ class NoRulesError(RuntimeError):
     @classmethod
     def checkpoint(cls):
         def check(tracepoint, **ctx):
-            if tracepoint == Tracepoint.NO_RULES:
-                return "'{state}' does not have any explicit nor implicit rules".format(**ctx)
+            if tracepoint is _TP_NO_RULES:
+                return "'{state}' does not have any explicit nor implicit rules".format_map(ctx)
 
         return (check, cls)
 
@@ -218,8 +281,8 @@ class UnrecognizedInputError(ValueError):
     @classmethod
     def checkpoint(cls):
         def check(tracepoint, **ctx):
-            if tracepoint == Tracepoint.UNRECOGNIZED:
-                return "'{state}' did not recognize {input_count}: '{input}'".format(**ctx)
+            if tracepoint is _TP_UNRECOGNIZED:
+                return "'{state}' did not recognize {input_count}: '{input}'".format_map(ctx)
 
         return (check, cls)
 
@@ -229,8 +292,8 @@ class UnknownStateError(RuntimeError):
     @classmethod
     def checkpoint(cls):
         def check(tracepoint, **ctx):
-            if tracepoint == Tracepoint.UNKNOWN_STATE:
-                return "'{new_state}' is not in the ruleset".format(**ctx)
+            if tracepoint is _TP_UNKNOWN_STATE:
+                return "'{new_state}' is not in the ruleset".format_map(ctx)
 
         return (check, cls)
 #####
@@ -239,9 +302,10 @@ class UnknownStateError(RuntimeError):
 ###  Tracing  ###
 def PrefixTracer(prefix="T>", printer=print):
     """Prints tracepoints with a distinctive prefix and, optionally, to a separate destination than other output"""
+    formatters = { tp: tp.value.format_map for tp in Tracepoint }  # Enum .value is a slow lookup, bind each format once
     def t(tp, **vals):
-        msg = f"{prefix} {tp.value.format(**vals)}" if prefix else tp.value.format(**vals)
-        printer(msg)
+        msg = formatters[tp](vals)  # vals is already a dict, no need to unpack it again
+        printer(f"{prefix} {msg}" if prefix else msg)
     return t
 
 
@@ -252,6 +316,7 @@ class CheckpointTracer(object):
 
     When it raises an error, it will include a traceback of the recent transitions, similar to a standard stack trace; this is extremely helpful for debugging.
     """
+    __slots__ = ("checkpoints", "context", "input_count", "history", "compact")
 
     DEFAULT_CHECKPOINTS = (
         NoRulesError.checkpoint(), 
@@ -287,7 +352,7 @@ class CheckpointTracer(object):
     ## Collect context & history
     def __call__(self, tracepoint, **values):
         values["tracepoint"] = tracepoint
-        if tracepoint == Tracepoint.INPUT:
+        if tracepoint is _TP_INPUT:
             if self.context:
                 self.history.append(self.context)
             self.input_count += 1
@@ -304,29 +369,28 @@ class CheckpointTracer(object):
                 ex.add_note(f"StateMachine Traceback (most recent last):\n  {trace_lines}\n{err.__name__}: {msg}")
                 raise ex
 
-        if self.compact and tracepoint == Tracepoint.NEW_STATE:
+        if self.compact and tracepoint is _TP_NEW_STATE and self.history:
             self._fold_loop()
 
     def _fold_loop(self):
-        if not self.history:
-            return
-
+        # Only called with some history to fold into
+        history = self.history
         latest = self.context
-        previous = self.history[-1]
+        previous = history[-1]
         if previous["state"] == latest["state"]:
             # We have looped
             if "loop_count" in previous:
                 # If we are already compacting, fold
                 latest["loop_count"] = previous["loop_count"] + 1
-                self.history.pop()
+                history.pop()
 
-            elif len(self.history) >= 2:
-                p_previous = self.history[-2]
+            elif len(history) >= 2:
+                p_previous = history[-2]
                 if p_previous["state"] == latest["state"]:
                     # Start compacting loops on the third iteration
                     latest["loop_count"] = 2
-                    self.history.pop()
-                    self.history.pop()
+                    history.pop()
+                    history.pop()
 
     ## Formatting
     def format_trace(self):
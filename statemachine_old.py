@@ -17,20 +17,28 @@ TransitionInfo = namedtuple("TransitionInfo", ("state", "dst", "count", "result"
 TraceInfo = namedtuple("TraceInfo", ("t_info", "test", "action", "tag", "out", "end"))
 
 
+def _no_op(*_):
+    """Baseline tracer and unrecognized handler; input skips building trace info when this is the tracer."""
+    return None
+
+
 class StateMachineCore(object):
     """State machine engine that makes minimal, but convenient, assumptions.
 
     StateMachineCore holds the primary implementation separate from the extras for clarity, but is not meant to be used directly; see StateMachine for full documentation.
     """
+    __slots__ = ("rules", "state", "i_count", "_merged", "tracer", "unrecognized")
+
     def __init__(self, start):
         """Creates a state machine in the start state."""
         self.rules = {start:[], None:[],}  # {state: [(test, dst, action, tag), ...], ...}
         self.state = start
         self.i_count = 0
+        self._merged = {}  # {state: ((test, test_callable, dst, action, action_callable, tag), ...), ...} built as states are used, reset by add
 
         # Baseline both tracer and unrecognized handler to no-ops
-        self.tracer = lambda *_: None
-        self.unrecognized = lambda *_: None
+        self.tracer = _no_op
+        self.unrecognized = _no_op
 
 
     def add(self, state, test, dst, action=None, tag=None):
@@ -40,25 +48,46 @@ class StateMachineCore(object):
         if dst not in self.rules:
             self.rules[dst] = []
         self.rules[state].append((test, dst, action, tag))  # REM: auto-tag "global" rules?
+        self._merged = {}
+
+
+    def _merge_rules(self, state):
+        """Merges a state's rules with the implicit ones and notes which tests and actions are callable, so that isn't redone for every input."""
+        # Rules starting from None are added to all states
+        rlist = tuple(
+            (test, callable(test), dst, action, callable(action), tag)
+            for (test, dst, action, tag) in (*self.rules.get(state, ()), *self.rules.get(None, ()))
+        )
+        self._merged[state] = rlist
+        return rlist
 
 
     def input(self, i):
         """Tests input `i` against current state's rules, changes state, and returns the output of the first matching rule's action."""
-        self.i_count += 1
-        rlist = self.rules.get(self.state, [])
-        for (test, dst, action, tag) in rlist + self.rules.get(None, []):  # Rules starting from None are added to all states
-            t_info = TransitionInfo(self.state, dst, self.i_count, None)
-            result = test(i, t_info) if callable(test) else test == i
-            t_info = t_info._replace(result=result)
+        count = self.i_count = self.i_count + 1
+        state = self.state
+        tracer = self.tracer
+        tracing = tracer is not _no_op
+        rlist = self._merged.get(state)
+        if rlist is None:
+            rlist = self._merge_rules(state)
+        for (test, test_c, dst, action, action_c, tag) in rlist:
+            if test_c:
+                result = test(i, TransitionInfo(state, dst, count, None))
+            else:
+                result = test == i  # No need for a pre-result TransitionInfo
             if result:
+                t_info = TransitionInfo(state, dst, count, result)  # Direct construction is much cheaper than _replace
                 if dst is not None:  # Transitions ending in None stay in the same state
                     self.state = dst
                 # Run the action after the state change so it could override the end state (e.g. pop state from a stack)
-                out = action(i, t_info) if callable(action) else action
+                out = action(i, t_info) if action_c else action
                 # Be sure to trace the actual end state after `action` is done
-                self.tracer(i, TraceInfo(t_info, test, action, tag, out, self.state))
+                if tracing:
+                    tracer(i, TraceInfo(t_info, test, action, tag, out, self.state))
                 return out
-            self.tracer(i, TraceInfo(t_info, test, action, tag, None, self.state))
+            if tracing:
+                tracer(i, TraceInfo(TransitionInfo(state, dst, count, result), test, action, tag, None, self.state))
 
         return self.unrecognized(i, self.state, self.i_count)
 #####
@@ -70,6 +99,8 @@ class StateMachine(StateMachineCore):
 
     This is a stripped-down [Mealy](https://en.wikipedia.org/wiki/Mealy_machine) (output depends on state and input) state machine engine.  Good for writing parsers, but makes no assumptions about text parsing, and doesn't have any unnecessary requirements for the states, tests, or actions that form the rules that wire up the machines it can run.
     """
+    __slots__ = ()
+
     def __init__(self, start, tracer=True, unrecognized=True):
         """Creates a state machine in the start state with an optional tracer and unrecognized input handler.
 
@@ -124,7 +155,7 @@ class StateMachine(StateMachineCore):
         for r in rules:
             if type(r) == dict:
                 self.add(state, **r)
-            elif [ type(i) for i in r ] == [tuple, dict]:
+            elif len(r) == 2 and type(r[0]) == tuple and type(r[1]) == dict:  # Check the shape directly, no need to build a list of types
                 args, kwargs = r
                 self.add(state, *args, **kwargs)
             else:
@@ -145,8 +176,9 @@ class StateMachine(StateMachineCore):
 
     def parse(self, inputs):
         "Feeds items from the `inputs` iterable into the state machine and yields non-None outputs"
+        input = self.input  # Bound once for the whole stream
         for i in inputs:
-            out = self.input(i)
+            out = input(i)
             if out is not None:
                 yield out
 #####
@@ -158,9 +190,17 @@ def true_test(i, _):
     return True
 
 
+_PLAIN_TYPES = (str, bytes, int, float, complex, bool, type(None))  # Their hash agrees with ==
 def in_test(l):
-    "Creates a test closure that returns true if an input is in `l`"
+    "Creates a test closure that returns true if an input is in `l`; a tuple of plain values is looked up in a frozenset"
+    if not (isinstance(l, tuple) and all( type(x) in _PLAIN_TYPES for x in l )):
+        def c(i, _):
+            return i in l
+        return c
+    lookup = frozenset(l)
     def c(i, _):
+        if type(i) in _PLAIN_TYPES:
+            return i in lookup
         return i in l
     return c
 
@@ -178,9 +218,9 @@ def any_test(l):
 
 def match_test(pattern, flags=0):
     "Creates a test closure that returns true if an input matches `pattern` using `re.match`"
-    r = re.compile(pattern, flags=flags)
+    match = re.compile(pattern, flags=flags).match
     def c(i, _):
-        return r.match(i)
+        return match(i)
     return c
 #####
 
@@ -202,6 +242,8 @@ def format_rule_table(sm):
 ###  Tracing  ###
 class Tracer():
     """Collects a trace of state machine transitions (or not) by input."""
+    __slots__ = ("input_count", "printer")
+
     def __init__(self, printer="T> "):
         """Creates a Tracer instance with a `printer` callback for lines of trace output.
 
@@ -239,6 +281,8 @@ class RecentTracer(object):
     """Keeps a limited trace of significant state machine transitions to provide a recent "traceback" particularly for understanding unrecognized input.
 
     Only "successful" transitions are recorded, and if a transition stays in the same state, those are counted but only the last is retained."""
+    __slots__ = ("buffer", "t_count")
+
     def __init__(self, depth=10):
         """Creates a RecentTracer instance with trace depth.
 
@@ -256,15 +300,15 @@ class RecentTracer(object):
         if not t_info.result:
             return
 
-        loop_count = 1
-        if len(self.buffer):
+        if self.buffer:
             (_, ((s, *_), *_), (lc, *_)) = self.buffer[-1]  # FIXME: this kind of unpacking is out of control
             if t_info.state == s and (t_info.state == t.end):
                 # if the state isn't changing, bump the loop count and replace the last entry
-                loop_count = lc + 1
-                self.buffer.pop()
+                self.buffer[-1] = (i, t, (lc + 1, self.t_count))
+                self.t_count = 0
+                return
 
-        self.buffer.append((i, t, (loop_count, self.t_count)))
+        self.buffer.append((i, t, (1, self.t_count)))
         self.t_count = 0
 
 
@@ -295,27 +339,28 @@ class RecentTracer(object):
 ###  Stack Machine  ###
 class StackMachine(StateMachine):
     """Stack machine based on the StateMachine engine above."""
+    __slots__ = ("stacks",)
+
     def __init__(self, start, tracer=True, unrecognized=True):
         super().__init__(start, tracer=tracer, unrecognized=unrecognized)  # TODO: may need to augment tracers to include stacks somehow
         self.stacks = {None: deque(),}  # Allow any number of named stacks; default stack is named `None`
 
 
     def len(self, stack=None):
-        if stack not in self.stacks:
-            return 0
-        return len(self.stacks[stack])
+        s = self.stacks.get(stack)
+        return len(s) if s is not None else 0
 
 
     def append(self, v, stack=None):
-        if stack not in self.stacks:
-            self.stacks[stack] = deque()
-        self.stacks[stack].append(v)
+        s = self.stacks.get(stack)
+        if s is None:
+            s = self.stacks[stack] = deque()
+        s.append(v)
 
 
     def pop(self, stack=None):
-        if stack not in self.stacks or len(self.stacks[stack]) < 1:
-            return None
-        return self.stacks[stack].pop()
+        s = self.stacks.get(stack)  # One lookup rather than a membership test and then indexing
+        return s.pop() if s else None
 
 
     def append_input_action(self, stack=None):